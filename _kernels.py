@@ -0,0 +1,56 @@
+try:
+    from numba import njit
+except ImportError:
+    # numba is optional; without it the kernels run as plain Python
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        return lambda function: function
+
+
+@njit(cache=True)
+def count_neighbors(type_grid, x, y, agent_type):
+    """
+    counts the agents of the given type in the Moore neighborhood of (x, y).
+    """
+    width, height = type_grid.shape
+    count = 0
+    for nx in range(max(x - 1, 0), min(x + 2, width)):
+        for ny in range(max(y - 1, 0), min(y + 2, height)):
+            if (nx != x or ny != y) and type_grid[nx, ny] == agent_type:
+                count += 1
+    return count
+
+
+@njit(cache=True)
+def scan_step(type_grid, agent_xy, agent_type_arr, order, homophily, empties, draws):
+    """
+    activates the agents of a model without influencers one at a time, in the given order.
+    an agent with at least `homophily` similar neighbors is happy, any other agent moves to
+    the empty cell picked by its draw, and the cell it leaves takes that slot in `empties`.
+    like SchellingGrid.move_to_empty, it raises when an agent has to move and no cell is empty.
+
+    type_grid, agent_xy and empties are updated in place; returns the number of happy agents.
+    """
+    happy = 0
+    num_empty = empties.shape[0]
+    for k in range(order.shape[0]):
+        index = order[k]
+        x = agent_xy[index, 0]
+        y = agent_xy[index, 1]
+        agent_type = agent_type_arr[index]
+        if count_neighbors(type_grid, x, y, agent_type) >= homophily:
+            happy += 1
+        elif num_empty == 0:
+            raise Exception("ERROR: No empty cells")
+        else:
+            slot = int(draws[k] * num_empty)
+            new_x = empties[slot, 0]
+            new_y = empties[slot, 1]
+            empties[slot, 0] = x
+            empties[slot, 1] = y
+            type_grid[x, y] = -1
+            type_grid[new_x, new_y] = agent_type
+            agent_xy[index, 0] = new_x
+            agent_xy[index, 1] = new_y
+    return happy
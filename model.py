@@ -1,6 +1,137 @@
 import mesa
 import numpy as np
 from mesa.datacollection import DataCollector
+from scipy.signal import convolve2d
+
+from _kernels import scan_step
+
+
+# influence types of agents; only influencers carry INFL_POS or INFL_NEG
+INFL_NONE, INFL_POS, INFL_NEG = 0, 1, 2
+
+# 3x3 Moore neighborhood with the center cell excluded
+MOORE_KERNEL = np.ones((3, 3), dtype=np.int8)
+MOORE_KERNEL[1, 1] = 0
+
+
+class SchellingGrid(mesa.space.SingleGrid):
+    """
+    a non-toroidal SingleGrid that mirrors agent state into NumPy layers, so that the
+    composition of a cell's Moore neighborhood can be read directly instead of scanning
+    the neighbors of every agent at every step.
+
+    Attributes:
+        type_grid (np.ndarray): the agent type in each cell, -1 where the cell is empty.
+        pos_infl (np.ndarray): 1 where a positive influencer sits, 0 elsewhere.
+        neg_infl (np.ndarray): 1 where a negative influencer sits, 0 elsewhere.
+        type_counts (np.ndarray or None): for each agent type, the number of neighbors of that
+            type around each cell, influencers included.
+        similar_counts (np.ndarray or None): for each agent type, the number of non-influencer
+            neighbors of that type around each cell.
+        pos_counts (np.ndarray or None): the number of positive influencers around each cell.
+        neg_counts (np.ndarray or None): the number of negative influencers around each cell.
+
+    Methods:
+        build_counts: computes the neighbor count layers, one convolution per layer. once built,
+            they are kept up to date as agents are placed and removed.
+        discard_counts: drops the neighbor count layers, ahead of a batch of moves after which
+            build_counts is called again.
+        empties_array: returns the empty cells as an (n, 2) array of coordinates.
+        move_to_empty: moves an agent to a uniformly chosen empty cell in constant time, drawing
+            from an indexed list of empty cells instead of sorting the empties set.
+    """
+
+    def __init__(self, width, height):
+        super().__init__(width, height, torus=False)
+        self.type_grid = np.full((width, height), -1, dtype=np.int8)
+        self.pos_infl = np.zeros((width, height), dtype=np.int8)
+        self.neg_infl = np.zeros((width, height), dtype=np.int8)
+        self.type_counts = None
+        self.similar_counts = None
+        self.pos_counts = None
+        self.neg_counts = None
+
+        # empty cells, with each cell's index in the list so that it can be swap-removed
+        self._empty_list = [(x, y) for x in range(width) for y in range(height)]
+        self._empty_index = {pos: i for i, pos in enumerate(self._empty_list)}
+
+    def build_counts(self):
+        plain = (self.pos_infl | self.neg_infl) == 0
+        self.type_counts = np.stack([
+            convolve2d(self.type_grid == agent_type, MOORE_KERNEL, mode='same')
+            for agent_type in (0, 1)]).astype(np.int8)
+        self.similar_counts = np.stack([
+            convolve2d((self.type_grid == agent_type) & plain, MOORE_KERNEL, mode='same')
+            for agent_type in (0, 1)]).astype(np.int8)
+        self.pos_counts = convolve2d(self.pos_infl, MOORE_KERNEL, mode='same').astype(np.int8)
+        self.neg_counts = convolve2d(self.neg_infl, MOORE_KERNEL, mode='same').astype(np.int8)
+
+    def discard_counts(self):
+        self.type_counts = None
+        self.similar_counts = None
+        self.pos_counts = None
+        self.neg_counts = None
+
+    def place_agent(self, agent, pos):
+        super().place_agent(agent, pos)
+        self._discard_empty(pos)
+        if agent.index is not None:
+            agent.model.agent_xy[agent.index] = pos
+        self.type_grid[pos] = agent.agent_type
+        if agent.is_influencer:
+            if agent.influence_type == INFL_POS:
+                self.pos_infl[pos] = 1
+            else:
+                self.neg_infl[pos] = 1
+        self._shift_counts(agent, pos, 1)
+
+    def remove_agent(self, agent):
+        pos = agent.pos
+        if pos is None:
+            return
+        super().remove_agent(agent)
+        self._add_empty(pos)
+        self.type_grid[pos] = -1
+        self.pos_infl[pos] = 0
+        self.neg_infl[pos] = 0
+        self._shift_counts(agent, pos, -1)
+
+    def empties_array(self):
+        return np.array(self._empty_list, dtype=np.int32).reshape(-1, 2)
+
+    def move_to_empty(self, agent):
+        if not self._empty_list:
+            raise Exception("ERROR: No empty cells")
+        new_pos = self._empty_list[int(agent.random.random() * len(self._empty_list))]
+        self.remove_agent(agent)
+        self.place_agent(agent, new_pos)
+
+    def _add_empty(self, pos):
+        self._empty_index[pos] = len(self._empty_list)
+        self._empty_list.append(pos)
+
+    def _discard_empty(self, pos):
+        index = self._empty_index.pop(pos)
+        last = self._empty_list.pop()
+        if last != pos:
+            self._empty_list[index] = last
+            self._empty_index[last] = index
+
+    def _shift_counts(self, agent, pos, delta):
+        if self.similar_counts is None:
+            return
+        x, y = pos
+        window = (slice(max(x - 1, 0), x + 2), slice(max(y - 1, 0), y + 2))
+        self.type_counts[agent.agent_type][window] += delta
+        self.type_counts[agent.agent_type, x, y] -= delta
+        if not agent.is_influencer:
+            counts = self.similar_counts[agent.agent_type]
+        elif agent.influence_type == INFL_POS:
+            counts = self.pos_counts
+        else:
+            counts = self.neg_counts
+        counts[window] += delta
+        counts[x, y] -= delta
 
 
 class SchellingAgent(mesa.Agent):
@@ -14,22 +145,30 @@ class SchellingAgent(mesa.Agent):
         agent_type (int): the type of the agent, used to determine the agent's group.
         pos (tuple): the position of the agent on the grid.
         is_influencer (bool): a flag indicating whether the agent is a social influencer.
-        influence_type (str or None): the type of influence ('positive' or 'negative') if the agent is an influencer.
+        influence_type (int): the type of influence (INFL_POS or INFL_NEG) if the agent is an influencer, INFL_NONE otherwise.
         tolerance_rate (int): the number of similar or majority agents needed around the influencer to be happy.
         radius (int): the radius in which the agent considers its neighbors for the Schelling model's rules.
         majority_agent_type (int): the agent type that is considered the majority in the environment.
         steps_since_last_move (int): counts the steps since the agent last moved.
+        index (int or None): the agent's row in the model's per-agent arrays.
 
     Methods:
-        reset: reinitializes the agent with its initial parameters.
         step: activates the agent's behavior for a step in the simulation.
         move_based_on_tolerance: moves the agent to an empty space if the tolerance condition is not met.
         move_based_on_influence_and_tolerance: decides the agent's movement based on influence and tolerance.
         double_move: attempts to move the agent twice if under negative influence.
-        select_new_position: Rrndomly selects a new position for the agent to move to from a list of possible positions.
+        select_new_position: randomly picks one element of the given sequence, e.g. an offset from _R2_OFFSETS.
     """
 
-    def __init__(self, unique_id, model, agent_type, pos, is_influencer=False, influence_type=None, tolerance_rate=0):
+    # mesa.Agent keeps a __dict__ for unique_id, model and pos; the attributes
+    # specific to this model live in slots
+    __slots__ = ('agent_type', 'is_influencer', 'influence_type', 'tolerance_rate',
+                 'radius', 'majority_agent_type', 'steps_since_last_move', 'index')
+
+    # (dx, dy) offsets of the radius-2 Moore neighborhood, center excluded
+    _R2_OFFSETS = tuple((dx, dy) for dx in range(-2, 3) for dy in range(-2, 3) if (dx, dy) != (0, 0))
+
+    def __init__(self, unique_id, model, agent_type, pos, is_influencer=False, influence_type=INFL_NONE, tolerance_rate=0, index=None):
         super().__init__(unique_id, model)
         self.pos = pos
         self.agent_type = agent_type
@@ -39,20 +178,7 @@ class SchellingAgent(mesa.Agent):
         self.radius=1
         self.majority_agent_type = 0
         self.steps_since_last_move = 0
-        self.agents = []
-
-        self.init_params = {
-            "unique_id": unique_id,
-            "model": model,
-            "agent_type": agent_type,
-            "pos": pos,
-            "is_influencer": is_influencer,
-            "influence_type": influence_type,
-            "tolerance_rate": tolerance_rate,
-        }
-
-    def reset(self):
-        self.__init__(**self.init_params)
+        self.index = index
 
     def step(self):
         if self.is_influencer:
@@ -61,51 +187,47 @@ class SchellingAgent(mesa.Agent):
             self.move_based_on_influence_and_tolerance()
 
     def move_based_on_tolerance(self):
-        neighbors = self.model.grid.get_neighbors(self.pos, moore=True, include_center=False)
-        
-        similar_count = sum(1 for neighbor in neighbors if neighbor.agent_type == self.agent_type)
-        majority_count = sum(1 for neighbor in neighbors if neighbor.agent_type == self.model.majority_agent_type)
-        
-        if similar_count + majority_count < self.tolerance_rate:
-            self.model.grid.move_to_empty(self)
- 
-   
-    def move_based_on_influence_and_tolerance(self):
-        neighbors = self.model.grid.get_neighbors(
-            self.pos, moore=True, include_center=False)
-        influencer_neighbors = [
-            agent for agent in neighbors]
+        model = self.model
+        grid = model.grid
+        x, y = self.pos
+        type_counts = grid.type_counts
 
-        similar = sum(
-            1 for neighbor in neighbors if not neighbor.is_influencer and neighbor.agent_type == self.agent_type)
+        if type_counts[self.agent_type, x, y] + type_counts[model.majority_agent_type, x, y] < self.tolerance_rate:
+            grid.move_to_empty(self)
 
-        if similar >= self.model.homophily:
-            self.model.happy += 1
+    def move_based_on_influence_and_tolerance(self):
+        model = self.model
+        grid = model.grid
+        x, y = self.pos
+
+        if grid.similar_counts[self.agent_type, x, y] >= model.homophily:
+            model.happy += 1
+        elif grid.pos_counts[x, y]:
+            pass
+        elif grid.neg_counts[x, y]:
+            self.double_move()
         else:
-            positive_influence = any(
-                agent.influence_type == 'positive' for agent in influencer_neighbors)
-            negative_influence = any(
-                agent.influence_type == 'negative' for agent in influencer_neighbors)
-
-            if positive_influence:
-                pass
-            elif negative_influence:
-                self.double_move()
-            else:
-                self.model.grid.move_to_empty(self)
+            grid.move_to_empty(self)
 
     def double_move(self):
-        for _ in range(2):  
-            possible_positions = self.model.grid.get_neighborhood(
-                self.pos, moore=True, include_center=False, radius=2)
-            new_position = self.select_new_position(possible_positions)
-            if self.model.grid.is_cell_empty(new_position):
-                self.model.grid.move_agent(self, new_position)
+        grid = self.model.grid
+        width, height = grid.width, grid.height
+        for _ in range(2):
+            x, y = self.pos
+            # redraw offsets that fall off the grid, so that the target stays uniform
+            # over the in-bounds part of the neighborhood
+            while True:
+                dx, dy = self.select_new_position(self._R2_OFFSETS)
+                new_x, new_y = x + dx, y + dy
+                if 0 <= new_x < width and 0 <= new_y < height:
+                    break
+            new_position = (new_x, new_y)
+            if grid.is_cell_empty(new_position):
+                grid.move_agent(self, new_position)
 
     def select_new_position(self, possible_positions):
         if possible_positions:
-            index = np.random.randint(0, len(possible_positions))
-            return possible_positions[index]
+            return possible_positions[int(self.model.random.random() * len(possible_positions))]
         return None
 
 
@@ -124,15 +246,21 @@ class Schelling(mesa.Model):
         tolerance_rate_type1 (int): the tolerance rate for type 1 influencers.
         num_type2 (int): the number of type 2(negative) influencers to be placed in the grid.
         tolerance_rate_type2 (int): The tolerance rate for type 2 influencers.
-        schedule (mesa.time.RandomActivation): the scheduler to activate agents each step.
-        grid (mesa.space.SingleGrid): the grid where agents are placed.
+        rng (np.random.Generator): a NumPy generator seeded from the model's random, used for bulk draws.
+        schedule (mesa.time.RandomActivation): the scheduler holding the agents; step activates them
+            directly and only advances its step and time counters, along with the model clock on Mesa 2.2+.
+        grid (SchellingGrid): the grid where agents are placed.
         happy (int): a count of agents that are currently happy with their location.
         majority_agent_type (int): Tte agent type that is considered the majority (not actively used).
         datacollector (mesa.DataCollector): collects and stores data on the model during simulation.
+        agent_list (list): the agents, in the order of the rows of the per-agent arrays below.
+        agent_xy (np.ndarray): the (x, y) position of each agent, kept in sync as agents move.
+        agent_type_arr (np.ndarray): the type of each agent.
 
     Methods:
         populate_agents: initializes the grid by randomly placing agents and influencers.
         step: advances the model by one step, activating each agent's step method in random order.
+            models without influencers run the activation in the compiled scan_step kernel instead.
     """
     def __init__(self, height=20, width=20, density=0.8, minority_pc=0.2, homophily=3,
                  num_type1=1, tolerance_rate_type1=8,
@@ -150,41 +278,86 @@ class Schelling(mesa.Model):
         self.num_type2 = num_type2
         self.tolerance_rate_type2 = tolerance_rate_type2
 
+        self.rng = np.random.default_rng(self.random.getrandbits(64))
         self.schedule = mesa.time.RandomActivation(self)
-        self.grid = mesa.space.SingleGrid(width, height, torus=False)
+        self.grid = SchellingGrid(width, height)
         self.happy = 0
         self.majority_agent_type = 0
 
         self.datacollector = DataCollector(
-            model_reporters={"Happy": lambda m: m.happy} 
+            model_reporters={"Happy": "happy"}
         )
         
         self.populate_agents()
 
     def populate_agents(self):
-        for i in range(self.height):
-            for j in range(self.width):
-                if self.random.random() < self.density:
-                    agent_type = 0 if np.random.random() > self.minority_pc else 1
-                    is_influencer = False
-                    influence_type = None
-                    tolerance_rate = None
-                    
-                    if self.num_type1 > 0:
-                        is_influencer = True
-                        influence_type = 'positive'
-                        tolerance_rate = self.tolerance_rate_type1
-                        self.num_type1 -= 1
-                    elif self.num_type2 > 0:
-                        is_influencer = True
-                        influence_type = 'negative'
-                        tolerance_rate = self.tolerance_rate_type2
-                        self.num_type2 -= 1
-
-                    agent = SchellingAgent(self.next_id(), self, agent_type, (i, j), is_influencer, influence_type, tolerance_rate)
-                    self.grid.place_agent(agent, (i, j))
-                    self.schedule.add(agent)
+        occupied = self.rng.random((self.width, self.height)) < self.density
+        types = (self.rng.random((self.width, self.height)) < self.minority_pc).astype(np.int8)
+        num_type1 = self.num_type1
+        num_type2 = self.num_type2
+
+        coords = np.argwhere(occupied)
+        self.agent_list = []
+        self.agent_xy = coords.astype(np.int32)
+        self.agent_type_arr = types[occupied]
+
+        for index, (x, y) in enumerate(coords.tolist()):
+            is_influencer = False
+            influence_type = INFL_NONE
+            tolerance_rate = None
+
+            if num_type1 > 0:
+                is_influencer = True
+                influence_type = INFL_POS
+                tolerance_rate = self.tolerance_rate_type1
+                num_type1 -= 1
+            elif num_type2 > 0:
+                is_influencer = True
+                influence_type = INFL_NEG
+                tolerance_rate = self.tolerance_rate_type2
+                num_type2 -= 1
+
+            agent = SchellingAgent(self.next_id(), self, int(types[x, y]), (x, y), is_influencer, influence_type, tolerance_rate, index)
+            self.grid.place_agent(agent, (x, y))
+            self.schedule.add(agent)
+            self.agent_list.append(agent)
+
+        self.grid.build_counts()
 
     def step(self):
         self.happy = 0
-        self.schedule.step()
\ No newline at end of file
+        if self.num_type1 == 0 and self.num_type2 == 0:
+            self._vectorized_step()
+        else:
+            # a shuffled walk over the plain agent list, as RandomActivation would do
+            # through its agent set
+            agents = list(self.agent_list)
+            self.random.shuffle(agents)
+            for agent in agents:
+                agent.step()
+        # schedule.step() is bypassed, so advance the scheduler's counters by hand; from
+        # Mesa 2.2 on, the scheduler's wrapped step also advances the model's own clock
+        self.schedule.steps += 1
+        self.schedule.time += 1
+        if hasattr(self, "_advance_time"):
+            self._advance_time()
+
+    def _vectorized_step(self):
+        # without influencers every agent follows the plain homophily rule, so the whole
+        # random activation runs in scan_step on copies of the grid state; the Mesa grid
+        # is then brought up to date by moving the agents that changed cell
+        grid = self.grid
+        num_agents = len(self.agent_list)
+        new_xy = self.agent_xy.copy()
+        self.happy = int(scan_step(
+            grid.type_grid.copy(), new_xy, self.agent_type_arr, self.rng.permutation(num_agents),
+            self.homophily, grid.empties_array(), self.rng.random(num_agents)))
+
+        # the count layers are rebuilt once rather than shifted for every move
+        grid.discard_counts()
+        moved = np.flatnonzero((new_xy != self.agent_xy).any(axis=1)).tolist()
+        for index in moved:
+            grid.remove_agent(self.agent_list[index])
+        for index in moved:
+            grid.place_agent(self.agent_list[index], tuple(new_xy[index].tolist()))
+        grid.build_counts()
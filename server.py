@@ -1,5 +1,5 @@
 import mesa
-from model import Schelling
+from model import INFL_NEG, INFL_NONE, INFL_POS, Schelling
 
 def get_happy_agents(model):
     """
@@ -7,25 +7,27 @@ def get_happy_agents(model):
     """
     return f"Happy agents: {model.happy}"
 
+_AGENT_PORTRAYAL = {"Shape": "circle", "r": 0.5, "Filled": "true", "Layer": 0, "stroke_color": "#FFFFFF"}
+_INFLUENCER_PORTRAYAL = {"Shape": "rect", "w": 0.8, "h": 0.8, "Filled": "true", "Layer": 0, "stroke_color": "#000000"}
+
+# portrayals keyed on (is_influencer, influence_type, agent_type)
+_PORTRAYALS = {
+    (False, INFL_NONE, 0): {**_AGENT_PORTRAYAL, "Color": "#808080"},
+    (False, INFL_NONE, 1): {**_AGENT_PORTRAYAL, "Color": "#0000FF"},
+    (True, INFL_POS, 0): {**_INFLUENCER_PORTRAYAL, "Color": "#FFA500"},
+    (True, INFL_POS, 1): {**_INFLUENCER_PORTRAYAL, "Color": "#FFA500"},
+    (True, INFL_NEG, 0): {**_INFLUENCER_PORTRAYAL, "Color": "#FF0000"},
+    (True, INFL_NEG, 1): {**_INFLUENCER_PORTRAYAL, "Color": "#FF0000"},
+}
+
 def schelling_draw(agent):
     """
     Portrayal Method for canvas. Differentiates between normal agents and social influencers.
     """
     if agent is None:
         return
-    portrayal = {"Shape": "circle", "r": 0.5, "Filled": "true", "Layer": 0}
-
-    if agent.is_influencer:
-        portrayal["Shape"] = "rect"  
-        portrayal["w"] = 0.8
-        portrayal["h"] = 0.8
-        portrayal["Color"] = "#FFA500" if agent.influence_type == 'positive' else "#FF0000"
-        portrayal["stroke_color"] = "#000000"
-    else:
-        portrayal["Color"] = "#808080" if agent.agent_type == 0 else "#0000FF"
-        portrayal["stroke_color"] = "#FFFFFF"
-
-    return portrayal
+    # the canvas writes the cell coordinates into the portrayal, so hand out a copy
+    return dict(_PORTRAYALS[(agent.is_influencer, agent.influence_type, agent.agent_type)])
 
 canvas_element = mesa.visualization.CanvasGrid(schelling_draw, 20, 20, 500, 500)
 